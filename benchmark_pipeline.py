@@ -0,0 +1,114 @@
+import argparse
+import hashlib
+import os
+import random
+import time
+
+from webscraping import FETCH_OK, fetch_html, process_urls
+
+# Benchmark the extraction stage of process_urls on recorded article HTML.
+#
+# Record some fixtures once (needs network):
+#   python benchmark_pipeline.py --record https://www.bankrate.com/banking/cds/fixed-annuities-vs-cds/ ...
+# Then benchmark offline:
+#   python benchmark_pipeline.py --articles 200
+# The committed fixtures/ are synthetic Bankrate-style pages made with
+#   python benchmark_pipeline.py --generate 4
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+# Save the raw HTML of each URL to the fixtures directory
+def record_fixtures(urls, fixture_dir):
+    os.makedirs(fixture_dir, exist_ok=True)
+    for url in urls:
+        html = fetch_html(url)
+        if not html:
+            print(f"Skipping {url}, nothing fetched")
+            continue
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()[:12] + '.html'
+        with open(os.path.join(fixture_dir, name), 'w', encoding='utf-8') as f:
+            f.write(html)
+        print(f"Recorded {url} -> {name}")
+
+
+# Write synthetic article pages shaped like Bankrate articles (contributor
+# byline, ArticleBody with headers, paragraphs and internal links)
+def generate_fixtures(count, fixture_dir, sections=12, seed=0):
+    rng = random.Random(seed)
+    words = ('rate annual deposit savings account interest bank yield term fixed '
+             'annuity certificate balance credit loan fee penalty withdrawal market').split()
+
+    def sentence():
+        return ' '.join(rng.choice(words) for _ in range(rng.randint(8, 20))).capitalize() + '.'
+
+    os.makedirs(fixture_dir, exist_ok=True)
+    for n in range(count):
+        body = []
+        for i in range(sections):
+            body.append(f'<h{2 + i % 2}>Section {i + 1}: {sentence()}</h{2 + i % 2}>')
+            for _ in range(rng.randint(3, 6)):
+                link = f'<a href="https://www.bankrate.com/banking/page-{rng.randint(1, 500)}/">{sentence()}</a>'
+                body.append(f'<p>{" ".join(sentence() for _ in range(4))} {link} {sentence()}</p>')
+        nav = ''.join(f'<li><a href="https://www.bankrate.com/nav-{i}/">Menu {i}</a></li>' for i in range(150))
+        html = f'''<!DOCTYPE html><html><head><meta charset="utf-8"><title>Synthetic article {n} | Bankrate</title>
+<style>{'.c{color:#000}' * 500}</style></head><body><nav><ul>{nav}</ul></nav>
+<div class="Byline"><div><span>Written by</span> <a href="https://www.bankrate.com/authors/writer-{n}/">Writer {n}</a></div>
+<div><span>Edited by</span> <a href="https://www.bankrate.com/authors/editor-{n}/">Editor {n}</a></div></div>
+<article><div class="ArticleBody">{''.join(body)}</div></article><footer>{nav}</footer></body></html>'''
+        name = f'synthetic-{n}.html'
+        with open(os.path.join(fixture_dir, name), 'w', encoding='utf-8') as f:
+            f.write(html)
+        print(f"Generated {name}")
+
+
+def load_fixtures(fixture_dir):
+    fixtures = {}
+    for name in sorted(os.listdir(fixture_dir)):
+        if name.endswith('.html'):
+            with open(os.path.join(fixture_dir, name), encoding='utf-8') as f:
+                fixtures[name] = f.read()
+    return fixtures
+
+
+class FixtureFetcher:
+    def __init__(self, fixtures):
+        self.fixtures = fixtures
+
+    def __call__(self, url):
+        # URLs look like "<fixture name>#<n>" so the same page can be reused
+        return {'html': self.fixtures[url.split('#')[0]], 'fetch_status': FETCH_OK}
+
+
+def run_benchmark(fixtures, articles, worker_counts):
+    names = list(fixtures)
+    urls = [f"{names[i % len(names)]}#{i}" for i in range(articles)]
+    fetch = FixtureFetcher(fixtures)
+
+    print(f"{'workers':>8} {'seconds':>10} {'articles/s':>12}")
+    for workers in worker_counts:
+        start = time.perf_counter()
+        results = process_urls(urls, workers=workers, follow_links=False, fetch=fetch)
+        elapsed = time.perf_counter() - start
+        parsed = sum(bool(result['article_text']) for result in results)
+        print(f"{workers:>8} {elapsed:>10.2f} {parsed / elapsed:>12.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark article extraction throughput on recorded fixtures")
+    parser.add_argument('--record', nargs='+', metavar='URL', help="fetch these URLs and save them as fixtures")
+    parser.add_argument('--generate', type=int, metavar='N', help="write N synthetic article fixtures")
+    parser.add_argument('--fixtures', default=FIXTURE_DIR, help="directory of recorded .html fixtures")
+    parser.add_argument('--articles', type=int, default=100, help="number of articles to process per run")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help="process pool sizes to try")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(args.record, args.fixtures)
+    elif args.generate:
+        generate_fixtures(args.generate, args.fixtures)
+    else:
+        fixtures = load_fixtures(args.fixtures) if os.path.isdir(args.fixtures) else {}
+        if not fixtures:
+            parser.error(f"no .html fixtures in {args.fixtures}, record some with --record first")
+        run_benchmark(fixtures, args.articles, args.workers)
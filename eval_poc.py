@@ -4,7 +4,7 @@ from openai import OpenAI
 from st_copy_to_clipboard import st_copy_to_clipboard
 # import pyperclip
 # Import the functions from the newly created Python file
-from webscraping import process_url
+from webscraping import process_url, FETCH_OK, FETCH_TRUNCATED, FETCH_TIMEOUT
 import os
 
 
@@ -60,6 +60,11 @@ url = st.text_input("Enter the URL to process",
 if st.button("Process URL"):
     if url:
         result = process_url(url)
+        # Tell the user why the page came back empty or incomplete
+        if result['fetch_status'] in (FETCH_TRUNCATED, FETCH_TIMEOUT):
+            st.warning(f"The page download was cut short ({result['fetch_status']}), so some content may be missing.")
+        elif result['fetch_status'] != FETCH_OK:
+            st.error(f"Could not extract the article from this URL ({result['fetch_status']}).")
         # Store the result in session state to keep track of the variables
         st.session_state.result = result
 else:
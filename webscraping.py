@@ -1,12 +1,18 @@
 from bs4 import BeautifulSoup
 import re
 import requests
-import pandas as pd
 from fake_useragent import UserAgent
 import random
+import codecs
 import time
+import functools
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import trafilatura
-from tenacity import retry, stop_after_attempt, wait_fixed, wait_random
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_fixed, wait_random
 
 # Helper function to truncate text
 def truncate_text(text, max_length=500):
@@ -23,44 +29,165 @@ from trafilatura.settings import use_config
 config = use_config()
 config.set("DEFAULT", "EXTRACTION_TIMEOUT", "0")
 
-# Retry settings for requests
-@retry(reraise=True, wait=wait_fixed(1) + wait_random(0, 1), stop=stop_after_attempt(2))
-def get_url_raw_data(url, headers, timeout=10):
-    result = requests.get(url, headers=headers, timeout=timeout, verify=False)
-    return result
-
-# Get text from URL
-def get_text_from_url(url):
+# Fetch limits. Bodies are streamed and cut off at MAX_RESPONSE_BYTES or after
+# MAX_FETCH_SECONDS, and anything that isn't HTML is dropped before its body is
+# downloaded. Functions taking max_bytes=None read MAX_RESPONSE_BYTES when
+# called, so changing it at runtime takes effect.
+MAX_RESPONSE_BYTES = 5 * 1024 * 1024
+MAX_FETCH_SECONDS = 30
+TITLE_MAX_BYTES = 256 * 1024
+MAX_REDIRECTS = 5
+CHUNK_SIZE = 64 * 1024
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+# Fetch statuses reported alongside the html
+FETCH_OK = 'ok'
+FETCH_TRUNCATED = 'truncated'
+FETCH_TIMEOUT = 'timeout'
+FETCH_REJECTED_CONTENT_TYPE = 'rejected_content_type'
+FETCH_HTTP_ERROR = 'http_error'
+FETCH_TOO_MANY_REDIRECTS = 'too_many_redirects'
+FETCH_ERROR = 'error'
+FETCH_NO_TEXT = 'no_text'
+FETCH_PARSE_ERROR = 'parse_error'
+
+CHARSET_RE = re.compile(r'charset\s*=\s*["\']?\s*([\w.:-]+)', re.I)
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.I)
+
+# Pick the charset from the Content-Type header, then from a <meta> tag near
+# the top of the page, falling back to utf-8. Avoids requests' apparent_encoding,
+# which runs charset detection over the whole body. Bytes-to-bytes codecs such
+# as base64 or zlib are valid codec names but can't decode a page, so skip them.
+BINARY_CODECS = {'base64', 'bz2', 'hex', 'quopri', 'uu', 'zlib', 'rot-13'}
+
+def detect_charset(content_type, body):
+    for match in (CHARSET_RE.search(content_type or ''), META_CHARSET_RE.search(body[:4096])):
+        if match:
+            charset = match.group(1)
+            if isinstance(charset, bytes):
+                charset = charset.decode('ascii', 'ignore')
+            try:
+                codec = codecs.lookup(charset)
+            except LookupError:
+                continue
+            if codec.name not in BINARY_CODECS:
+                return codec.name
+    return 'utf-8'
+
+def decode_body(content_type, body):
+    try:
+        return body.decode(detect_charset(content_type, body), errors='replace')
+    except (LookupError, UnicodeError):
+        return body.decode('utf-8', errors='replace')
+
+# Single request, streamed and capped in size and total time. timeout only
+# bounds each socket read, so a server trickling bytes needs the deadline too.
+def read_url(url, headers, timeout=10, max_bytes=None, max_seconds=None):
+    max_bytes = max_bytes or MAX_RESPONSE_BYTES
+    deadline = time.monotonic() + (max_seconds or MAX_FETCH_SECONDS)
+    page = {'html': '', 'status_code': None, 'content_type': '', 'fetch_status': FETCH_OK}
+    with requests.Session() as session:
+        session.max_redirects = MAX_REDIRECTS
+        with session.get(url, headers=headers, timeout=timeout, verify=False, stream=True) as result:
+            page['status_code'] = result.status_code
+            page['content_type'] = result.headers.get('Content-Type', '')
+            if result.status_code != 200:
+                page['fetch_status'] = FETCH_HTTP_ERROR
+                return page
+            media_type = page['content_type'].split(';')[0].strip().lower()
+            if media_type and media_type not in HTML_CONTENT_TYPES:
+                page['fetch_status'] = FETCH_REJECTED_CONTENT_TYPE
+                return page
+
+            # read1 returns whatever has arrived instead of waiting for a full
+            # chunk (urllib3 2), so the deadline is checked while data trickles in
+            read_chunk = getattr(result.raw, 'read1', result.raw.read)
+            body = bytearray()
+            while True:
+                if time.monotonic() > deadline:
+                    page['fetch_status'] = FETCH_TIMEOUT
+                    break
+                chunk = read_chunk(CHUNK_SIZE, decode_content=True)
+                if not chunk:
+                    break
+                body.extend(chunk)
+                if len(body) > max_bytes:
+                    del body[max_bytes:]
+                    page['fetch_status'] = FETCH_TRUNCATED
+                    break
+
+    page['html'] = decode_body(page['content_type'], bytes(body))
+    return page
+
+# Retry settings for requests (a redirect loop won't fix itself, so don't retry it)
+@retry(reraise=True, wait=wait_fixed(1) + wait_random(0, 1), stop=stop_after_attempt(2),
+       retry=retry_if_not_exception_type(requests.TooManyRedirects))
+def get_url_raw_data(url, headers, timeout=10, max_bytes=None):
+    return read_url(url, headers, timeout=timeout, max_bytes=max_bytes)
+
+# Fetch a page (I/O stage). Returns a dict with the html and a fetch_status
+# saying why the html may be empty or incomplete.
+def fetch_page(url, max_bytes=None):
+    max_bytes = max_bytes or MAX_RESPONSE_BYTES
     try:
         ua = UserAgent()
         headers = {'User-Agent': ua.random}
         time.sleep(random.uniform(0, 1))
-        result = get_url_raw_data(url, headers)
-        assert result.status_code == 200
-        html = result.text
-
+        page = get_url_raw_data(url, headers, max_bytes=max_bytes)
+    except requests.TooManyRedirects as e:
+        logger.error(f"Error fetching URL {url}, returning empty html: {e}")
+        return {'html': '', 'status_code': None, 'content_type': '', 'fetch_status': FETCH_TOO_MANY_REDIRECTS}
+    except Exception as e:
+        logger.error(f"Error fetching URL {url}, returning empty html: {e}")
+        return {'html': '', 'status_code': None, 'content_type': '', 'fetch_status': FETCH_ERROR}
+
+    if page['fetch_status'] == FETCH_TRUNCATED:
+        logger.warning(f"URL {url} is larger than {max_bytes} bytes, truncated")
+    elif page['fetch_status'] == FETCH_TIMEOUT:
+        logger.warning(f"URL {url} took longer than {MAX_FETCH_SECONDS} seconds, truncated")
+    elif page['fetch_status'] != FETCH_OK:
+        logger.error(f"Skipping URL {url}: {page['fetch_status']} "
+                     f"(status {page['status_code']}, content type {page['content_type']!r})")
+    return page
+
+# Fetch raw HTML from URL
+def fetch_html(url, max_bytes=None):
+    return fetch_page(url, max_bytes)['html']
+
+# Extract text and title from HTML (CPU stage)
+def extract_text_and_title(html, url=None):
+    try:
+        text = trafilatura.extract(html, url=url, config=config, favor_precision=True, favor_recall=False)
+        meta = trafilatura.extract_metadata(html)
+        title = meta.title.replace(' | Bankrate', '').replace(' - CreditCards.com', '')
+    except:
         try:
-            text = trafilatura.extract(html, url=url, config=config, favor_precision=True, favor_recall=False)
-            meta = trafilatura.extract_metadata(html)
-            title = meta.title.replace(' | Bankrate', '').replace(' - CreditCards.com', '')
-        except:
             soup = BeautifulSoup(html, 'html.parser')
             for unwanted in soup(['script', 'style']):
                 unwanted.decompose()
             text = soup.get_text(separator=' ')
             title = soup.title.string.replace(' | Bankrate', '').replace(' - CreditCards.com', '')
+        except Exception as e:
+            logger.error(f"Error extracting text from URL {url}, returning empty texts: {e}")
+            return '', ''
 
-        if isinstance(text, str):
-            return text, title, html
-        else:
-            logger.error(f"Error from URL {url}, returning empty texts")
-            return '', '', ''
-    except Exception as e:
-        logger.error(f"Error getting text from URL {url}, returning empty texts: {e}")
+    if isinstance(text, str):
+        return text, title
+    logger.error(f"Error from URL {url}, returning empty texts")
+    return '', ''
+
+# Get text from URL
+def get_text_from_url(url, max_bytes=None):
+    html = fetch_html(url, max_bytes)
+    if not html:
+        return '', '', ''
+    text, title = extract_text_and_title(html, url)
+    if not text:
         return '', '', ''
+    return text, title, html
 
-# Extract links with types
-def extract_links_with_types(html_content):
+# Find contributor links (CPU stage, no network)
+def find_contributor_links(html_content):
     soup = BeautifulSoup(html_content, 'html.parser')
     unique_links = {}
 
@@ -79,42 +206,9 @@ def extract_links_with_types(html_content):
                 for a_tag in a_tags:
                     href = a_tag['href']
                     if 'www.bankrate.com' in href and href not in unique_links:
-                        text, title, html = get_text_from_url(href)
-                        unique_links[href] = {
-                            'link_type': role,
-                            'body_text': text
-                        }
-
-    link_details = [{'url': url, 'link_type': details['link_type'], 'body_text': details['body_text']} for url, details in unique_links.items()]
-    return link_details
-
-# Prepare data for DataFrame
-def prepare_data_for_df(links, df):
-    data = {
-        'source_url': df['source_url'][0],
-        'text': df['text'][0],
-        'title': df['title'][0],
-        'html': df['html'][0]
-    }
-
-    link_types = ['Writer', 'Editor', 'Reviewer']
-    type_counters = {t: 0 for t in link_types}
-
-    for link in links:
-        link_type = link['link_type']
-        url_key = f"{link_type.lower()}_page_url_{type_counters[link_type] + 1}"
-        text_key = f"{link_type.lower()}_page_text_{type_counters[link_type] + 1}"
-        
-        if url_key not in data:
-            data[url_key] = []
-        if text_key not in data:
-            data[text_key] = []
-        
-        data[url_key].append(link['url'])
-        data[text_key].append(link['body_text'])
-        type_counters[link_type] += 1
+                        unique_links[href] = role
 
-    return data
+    return [{'url': url, 'link_type': role} for url, role in unique_links.items()]
 
 # Extract header info
 def extract_header_info(html_content):
@@ -154,31 +248,34 @@ def extract_header_info(html_content):
 
     return header_info
 
-# Extract internal links
-def extract_internal_links(html_content):
+# Find internal links (CPU stage, no network)
+def find_internal_links(html_content):
     soup = BeautifulSoup(html_content, 'html.parser')
     article_body = soup.find('div', class_='ArticleBody')
+
+    if not article_body:
+        return []
+
     links = article_body.find_all('a', href=True)
     internal_links = []
 
     for link in links:
         url = link['href']
         if "www.bankrate.com" in url:
-            anchor_text = link.get_text(strip=True)
-            title_of_linked_page = fetch_title_of_page(url)
             internal_links.append({
                 'internal_link_url': url,
-                'anchor_text': anchor_text,
-                'title_of_linked_page': title_of_linked_page
+                'anchor_text': link.get_text(strip=True)
             })
 
     return internal_links
 
 def fetch_title_of_page(url):
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            page_soup = BeautifulSoup(response.content, 'html.parser')
+        # One attempt, no retry, and the title is in the <head> so the start
+        # of the page is enough
+        page = read_url(url, {}, max_bytes=TITLE_MAX_BYTES)
+        if page['html']:
+            page_soup = BeautifulSoup(page['html'], 'html.parser')
             title_tag = page_soup.find('title')
             if title_tag:
                 title_text = title_tag.get_text(strip=True)
@@ -190,51 +287,236 @@ def fetch_title_of_page(url):
         print(f"Failed to retrieve page title from {url}: {str(e)}")
     return 'No Title Available'
 
-# Build document DataFrame
-def build_document_dataframe(retrieved_document_urls):
-    document_list = []
-    for url in retrieved_document_urls:
-        document, title, html = get_text_from_url(url)
-        if len(document) > 0:
-            document_list.append({'source_url': url, 'text': document, 'title': title, 'html': html})
-    return document_list
-
-# Main function to process the URL and output required variables
-def process_url(url):
-    # Step 1: Create a DataFrame from the URL
-    internal_df = pd.DataFrame(build_document_dataframe([url]))
-
-    # Step 2: Extract contributor links
-    test_links = extract_links_with_types(internal_df['html'][0])
-
-    # Step 3: Prepare DataFrame with contributor information
-    data1 = pd.DataFrame(prepare_data_for_df(test_links, internal_df))
+# Parse a fetched article (CPU stage). Runs in a worker process, so it only
+# takes and returns plain picklable data and never touches the network.
+def parse_article(url, html, fetch_status=FETCH_OK):
+    if not html:
+        return None
+    text, title = extract_text_and_title(html, url)
+    if not text:
+        return None
+    return {
+        'source_url': url,
+        'fetch_status': fetch_status,
+        'title': title,
+        'text': text,
+        'contributor_links': find_contributor_links(html),
+        'headers_info': extract_header_info(html),
+        'internal_links': find_internal_links(html)
+    }
 
-    # Step 4: Extract headers and body text
-    headers_list = extract_header_info(data1['html'][0])
-    data1['headers_info'] = [headers_list]
+_page_cache_lock = threading.Lock()
+
+# Body text of a contributor page, fetched once per page_cache. The cache
+# holds futures so threads asking for a page that is being fetched wait for it.
+def cached_text_from_url(url, page_cache, max_bytes=None):
+    with _page_cache_lock:
+        future = page_cache.get(url)
+        fetch_it = future is None
+        if fetch_it:
+            future = page_cache[url] = Future()
+    if fetch_it:
+        try:
+            future.set_result(get_text_from_url(url, max_bytes)[0])
+        except Exception as e:
+            future.set_exception(e)
+    return future.result()
+
+# Fetch the contributor pages and linked page titles of a parsed article
+# (I/O stage) and build the output variables. Contributor pages are shared
+# by many articles, so pass a dict as page_cache to fetch each one once.
+def resolve_article(parsed, follow_links=True, page_cache=None, max_bytes=None):
+    if page_cache is None:
+        page_cache = {}
+
+    # Text of the first Writer and first Editor page
+    page_texts = {}
+    for link in parsed['contributor_links']:
+        if link['link_type'] in ('Writer', 'Editor') and link['link_type'] not in page_texts:
+            page_texts[link['link_type']] = cached_text_from_url(link['url'], page_cache, max_bytes) if follow_links else ''
 
-    # Step 5: Extract internal links
-    urls = extract_internal_links(data1['html'][0])
-    data1['internal_link_info'] = [urls]
+    internal_links = []
+    for link in parsed['internal_links']:
+        title_of_linked_page = fetch_title_of_page(link['internal_link_url']) if follow_links else None
+        internal_links.append(dict(link, title_of_linked_page=title_of_linked_page))
 
-    # Extract variables
-    article_title = data1['title'][0]
-    article_text = data1['text'][0]
-    article_internal_links = data1['internal_link_info'][0]
-    article_headers_info = data1['headers_info'][0]
-    writer_page_text_1 = data1['writer_page_text_1'][0] if 'writer_page_text_1' in data1 else None
-    editor_page_text_1 = data1['editor_page_text_1'][0] if 'editor_page_text_1' in data1 else None
+    return {
+        'article_title': parsed['title'],
+        'article_text': parsed['text'],
+        'article_internal_links': internal_links,
+        'article_headers_info': parsed['headers_info'],
+        'writer_page_text_1': page_texts.get('Writer'),
+        'editor_page_text_1': page_texts.get('Editor'),
+        'fetch_status': parsed['fetch_status']
+    }
 
+# Output variables for a page that gave no article text, with the reason.
+# A truncated or timed out page keeps its status, since that's the likely cause.
+def empty_result(fetch_status):
+    if fetch_status == FETCH_OK:
+        fetch_status = FETCH_NO_TEXT
     return {
-        'article_title': article_title,
-        'article_text': article_text,
-        'article_internal_links': article_internal_links,
-        'article_headers_info': article_headers_info,
-        'writer_page_text_1': writer_page_text_1,
-        'editor_page_text_1': editor_page_text_1
+        'article_title': '',
+        'article_text': '',
+        'article_internal_links': [],
+        'article_headers_info': [],
+        'writer_page_text_1': None,
+        'editor_page_text_1': None,
+        'fetch_status': fetch_status
     }
 
+# Main function to process the URL and output required variables
+def process_url(url, max_bytes=None):
+    page = fetch_page(url, max_bytes)
+    try:
+        parsed = parse_article(url, page['html'], page['fetch_status'])
+    except Exception as e:
+        logger.error(f"Error parsing URL {url}: {e}")
+        return empty_result(FETCH_PARSE_ERROR)
+    if parsed is None:
+        return empty_result(page['fetch_status'])
+    try:
+        return resolve_article(parsed, max_bytes=max_bytes)
+    except Exception as e:
+        logger.error(f"Error resolving URL {url}: {e}")
+        return empty_result(FETCH_ERROR)
+
+# Process many URLs. Fetching runs in fetch_threads threads, parsing runs in a
+# pool of `workers` processes so it scales across cores, and the follow-up
+# fetches run in threads again. At most max_pending articles are in flight
+# across the stages so a fast stage can't run ahead and fill up memory.
+# Returns results in the same order as urls. fetch must return a dict like
+# fetch_page; pages that gave no text come back as empty_result(fetch_status).
+def process_urls(urls, workers=4, fetch_threads=8, max_pending=None, follow_links=True, fetch=None, max_bytes=None):
+    urls = list(urls)
+    fetch = fetch or functools.partial(fetch_page, max_bytes=max_bytes)
+    max_pending = max_pending or workers * 2
+    results = [None] * len(urls)
+    remaining = len(urls)
+
+    todo = queue.Queue()
+    for item in enumerate(urls):
+        todo.put(item)
+    # Every stage reports (stage, index, url, payload) here. A fetcher takes a
+    # slot before fetching and finish() gives it back, which bounds the pipeline.
+    events = queue.Queue()
+    slots = threading.Semaphore(max_pending)
+    stopping = threading.Event()
+
+    def fetch_worker():
+        while True:
+            slots.acquire()
+            if stopping.is_set():
+                return
+            try:
+                index, url = todo.get_nowait()
+            except queue.Empty:
+                slots.release()
+                return
+            try:
+                page = fetch(url)
+            except Exception as e:
+                logger.error(f"Error fetching URL {url}: {e}")
+                page = {'html': '', 'fetch_status': FETCH_ERROR}
+            events.put(('fetched', index, url, page))
+
+    def report(stage, index, url):
+        return lambda future: events.put((stage, index, url, future))
+
+    def finish(index, result):
+        nonlocal remaining
+        results[index] = result
+        remaining -= 1
+        slots.release()
+
+    # Forking while the fetcher threads hold locks (requests, logging) can
+    # leave a worker deadlocked, so start workers from a clean process instead
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    mp_context = multiprocessing.get_context(start_method)
+    parse_pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+    pool_generation = 0
+    resolve_pool = ThreadPoolExecutor(max_workers=fetch_threads)
+    # index -> [url, page, pool generation, already retried] while parsing
+    parsing = {}
+    page_cache = {}
+
+    # A worker that dies (e.g. out of memory on a huge page) breaks the whole
+    # pool, so start a new one; broken futures from the old pool are retried once
+    def restart_parse_pool():
+        nonlocal parse_pool, pool_generation
+        logger.error("A parse worker died, restarting the process pool")
+        parse_pool.shutdown(wait=False)
+        parse_pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+        pool_generation += 1
+
+    def submit_parse(index):
+        url, page = parsing[index][:2]
+        try:
+            future = parse_pool.submit(parse_article, url, page['html'], page['fetch_status'])
+        except BrokenProcessPool:
+            restart_parse_pool()
+            future = parse_pool.submit(parse_article, url, page['html'], page['fetch_status'])
+        parsing[index][2] = pool_generation
+        future.add_done_callback(report('parsed', index, url))
+
+    fetchers = [threading.Thread(target=fetch_worker, daemon=True) for _ in range(fetch_threads)]
+    try:
+        for thread in fetchers:
+            thread.start()
+
+        while remaining:
+            stage, index, url, payload = events.get()
+
+            if stage == 'fetched':
+                if not payload['html']:
+                    finish(index, empty_result(payload['fetch_status']))
+                    continue
+                parsing[index] = [url, payload, pool_generation, False]
+                submit_parse(index)
+
+            elif stage == 'parsed':
+                page, generation, retried = parsing[index][1:]
+                try:
+                    parsed = payload.result()
+                except BrokenProcessPool:
+                    if generation == pool_generation:
+                        restart_parse_pool()
+                    if not retried:
+                        parsing[index][3] = True
+                        submit_parse(index)
+                        continue
+                    logger.error(f"Error parsing URL {url}: worker died twice")
+                    del parsing[index]
+                    finish(index, empty_result(FETCH_PARSE_ERROR))
+                    continue
+                except Exception as e:
+                    logger.error(f"Error parsing URL {url}: {e}")
+                    del parsing[index]
+                    finish(index, empty_result(FETCH_PARSE_ERROR))
+                    continue
+                del parsing[index]
+                if parsed is None:
+                    finish(index, empty_result(page['fetch_status']))
+                else:
+                    future = resolve_pool.submit(resolve_article, parsed, follow_links, page_cache, max_bytes)
+                    future.add_done_callback(report('resolved', index, url))
+
+            else:
+                try:
+                    finish(index, payload.result())
+                except Exception as e:
+                    logger.error(f"Error resolving URL {url}: {e}")
+                    finish(index, empty_result(FETCH_ERROR))
+    finally:
+        # Wake up any fetcher still waiting for a slot so it can exit
+        stopping.set()
+        for _ in fetchers:
+            slots.release()
+        parse_pool.shutdown(cancel_futures=True)
+        resolve_pool.shutdown(cancel_futures=True)
+
+    return results
+
 # # Example usage
 # url = 'https://www.bankrate.com/banking/cds/fixed-annuities-vs-cds/'
 # result = process_url(url)